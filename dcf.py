@@ -0,0 +1,575 @@
+import warnings
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# Everything the valuation reads from the fundamentals; nothing else is fetched
+DCF_FIELDS = {
+    "financials": ["Total Revenue"],
+    "balance_sheet": ["Cash", "Long Term Debt"],
+    "info": ["longName", "sector", "marketCap", "sharesOutstanding", "currentPrice"],
+}
+
+# Schedule arrays and their labels in the projections table, in display order
+PROJECTION_COLUMNS = {
+    "revenue": "Revenue (M)",
+    "ebit": "EBIT (M)",
+    "nopat": "NOPAT (M)",
+    "depreciation": "Depreciation (M)",
+    "capex": "CapEx (M)",
+    "nwc_change": "∆NWC (M)",
+    "fcf": "FCF (M)",
+    "discount_factor": "Discount Factor",
+    "discounted_fcf": "Discounted FCF (M)",
+}
+
+# Assumptions that make no sense below zero
+NON_NEGATIVE = ("tax_rate", "capex_pct", "dep_pct", "nwc_pct")
+
+# Default (revenue growth, EBIT margin) for each scenario
+SCENARIOS = {
+    "Base": (0.05, 0.25),
+    "Bull": (0.10, 0.30),
+    "Bear": (0.03, 0.15),
+}
+
+
+class Assumptions(NamedTuple):
+    # Each field is a scalar or an array; arrays broadcast against each other, so
+    # N assumption sets are just fields of shape (N,)
+    growth_rate: object
+    ebit_margin: object
+    tax_rate: object
+    capex_pct: object
+    dep_pct: object
+    nwc_pct: object
+    discount_rate: object
+    terminal_growth: object
+
+
+class Fade(NamedTuple):
+    # Multi-stage forecast: growth and EBIT margin hold for `hold_years`, then move in
+    # a straight line to their targets by the last forecast year. A margin target of
+    # None keeps the margin where it is.
+    hold_years: int
+    growth_target: float
+    margin_target: float = None
+
+
+class Valuation(NamedTuple):
+    enterprise_value: np.ndarray  # $M
+    equity_value: np.ndarray  # $
+    price_per_share: np.ndarray  # $
+
+
+class Grid(NamedTuple):
+    # Valuation over discount rate (rows) x terminal growth (columns), as plain floats
+    discount_rate: np.ndarray
+    terminal_growth: np.ndarray
+    enterprise_value: np.ndarray  # $M
+    equity_value: np.ndarray  # $
+    price_per_share: np.ndarray  # $
+
+
+# Grid outputs: display label and the divisor that puts them in its units
+GRID_OUTPUTS = {
+    "enterprise_value": ("EV ($B)", 1e3),
+    "equity_value": ("Equity Value ($B)", 1e9),
+    "price_per_share": ("Price per Share", 1),
+}
+
+
+class Cube(NamedTuple):
+    # Valuation over the Cartesian product of assumption axes: `axes` maps each varied
+    # assumption to its values, in the order of the value array's dimensions
+    axes: dict
+    enterprise_value: np.ndarray  # $M
+
+
+# Largest sensitivity cube: axes and total cells
+CUBE_MAX_AXES = 6
+CUBE_MAX_CELLS = 5_000_000
+
+# Cell-years evaluated at once by the chunked grid kernels, to bound their memory
+CHUNK_SIZE = 2_000_000
+
+# Discount rates the cached tables cover: 0% to 50% in steps of 0.05%
+DISCOUNT_STEP = 0.0005
+DISCOUNT_MAX = 0.5
+
+
+def discount_times(horizon, mid_year=False):
+    # Years from now each forecast cash flow is discounted over: 1, 2, ... or, under
+    # the mid-year convention, 0.5, 1.5, ...
+    return np.arange(1, horizon + 1) - (0.5 if mid_year else 0.0)
+
+
+@lru_cache(maxsize=16)
+def discount_table(horizon, mid_year=False):
+    # (rates x years) table of 1 / (1 + d)^t, t from discount_times
+    rates = np.arange(round(DISCOUNT_MAX / DISCOUNT_STEP) + 1) * DISCOUNT_STEP
+    table = 1 / (1 + rates[:, None]) ** discount_times(horizon, mid_year)
+    table.flags.writeable = False
+    return table
+
+
+def _table_rows(rates, table):
+    # Row of the table for each rate when every rate is on its grid, else None
+    index = np.rint(rates / DISCOUNT_STEP)
+    if np.all((np.abs(index * DISCOUNT_STEP - rates) < 1e-12) & (index >= 0) & (index < len(table))):
+        return index.astype(int)
+    return None
+
+
+def discount_factors(discount_rate, horizon, mid_year=False):
+    # Factors for each rate over the horizon, shaped discount_rate.shape + (horizon,).
+    # Rates on the table grid (every slider value is) are looked up, not recomputed.
+    rates = np.asarray(discount_rate, dtype=float)
+    table = discount_table(horizon, mid_year)
+    rows = _table_rows(rates, table)
+    if rows is not None:
+        return table[rows]
+    return 1 / (1 + rates[..., None]) ** discount_times(horizon, mid_year)
+
+
+def terminal_factor(discount_rate, horizon):
+    # 1 / (1 + d)^horizon only, shaped like discount_rate: the terminal value is
+    # discounted from the end of the final year under either convention. Reads one
+    # table column rather than gathering whole rows.
+    rates = np.asarray(discount_rate, dtype=float)
+    table = discount_table(horizon)
+    rows = _table_rows(rates, table)
+    if rows is not None:
+        return table[rows, -1]
+    return 1 / (1 + rates) ** horizon
+
+
+def _per_year(x):
+    # Give an assumption a trailing axis to broadcast against the forecast years
+    return np.asarray(x, dtype=float)[..., None]
+
+
+def fade_path(start, end, years, hold_years):
+    # Per-year path from `start` (held for hold_years) to `end` in the last year,
+    # shaped broadcast(start, end) + (years,)
+    t = np.arange(1, years + 1)
+    weight = np.clip((t - hold_years) / max(years - hold_years, 1), 0, 1)
+    start = _per_year(start)
+    return start + (_per_year(end) - start) * weight
+
+
+def fade_paths(assumptions, fade, years):
+    # (growth path, margin path) for project(); None where the assumption stays constant
+    if fade is None:
+        return None, None
+    growth_path = fade_path(assumptions.growth_rate, fade.growth_target, years, fade.hold_years)
+    if fade.margin_target is None:
+        return growth_path, None
+    return growth_path, fade_path(assumptions.ebit_margin, fade.margin_target, years, fade.hold_years)
+
+
+def project(last_revenue, growth_rate, ebit_margin, tax_rate, capex_pct, dep_pct, nwc_pct, discount_rate, years=5,
+            mid_year=False, growth_path=None, margin_path=None):
+    # Forecast schedule as arrays whose last axis is the forecast year; array
+    # assumptions add their (broadcast) shape in front. Per-year growth and margin
+    # paths (see fade_paths) replace the constant rates when given.
+    last_revenue, growth_rate, ebit_margin, tax_rate, capex_pct, dep_pct, nwc_pct = map(
+        _per_year, (last_revenue, growth_rate, ebit_margin, tax_rate, capex_pct, dep_pct, nwc_pct)
+    )
+    t = np.arange(1, years + 1)
+    if growth_path is None:
+        revenue = last_revenue * (1 + growth_rate) ** t
+    else:
+        revenue = last_revenue * np.cumprod(1 + growth_path, axis=-1)
+    if margin_path is not None:
+        ebit_margin = margin_path
+    ebit = revenue * ebit_margin
+    nopat = ebit - ebit * tax_rate
+    depreciation = revenue * dep_pct
+    capex = revenue * capex_pct
+    nwc_change = revenue * nwc_pct
+    fcf = nopat + depreciation - capex - nwc_change
+    discount_factor = discount_factors(discount_rate, years, mid_year)
+    return {
+        "revenue": revenue,
+        "ebit": ebit,
+        "nopat": nopat,
+        "depreciation": depreciation,
+        "capex": capex,
+        "nwc_change": nwc_change,
+        "fcf": fcf,
+        "discount_factor": discount_factor,
+        "discounted_fcf": fcf * discount_factor,
+    }
+
+
+def terminal_value(schedule, discount_rate, terminal_growth):
+    # Gordon growth value after the last forecast year, and its present value
+    # (discounted from the end of that year under either convention)
+    years = schedule["fcf"].shape[-1]
+    tv = schedule["fcf"][..., -1] * (1 + terminal_growth) / (discount_rate - terminal_growth)
+    return tv, tv * terminal_factor(discount_rate, years)
+
+
+def enterprise_value(schedule, discount_rate, terminal_growth):
+    _, tv_disc = terminal_value(schedule, discount_rate, terminal_growth)
+    return schedule["discounted_fcf"].sum(axis=-1) + tv_disc
+
+
+def fcf_enterprise_value(fcf, discount_rate, terminal_growth, mid_year=False):
+    # EV of a bare FCF schedule (last axis the forecast year)
+    schedule = {"fcf": fcf, "discounted_fcf": fcf * discount_factors(discount_rate, fcf.shape[-1], mid_year)}
+    return enterprise_value(schedule, discount_rate, terminal_growth)
+
+
+def equity_bridge(enterprise_value, cash=0, debt=0, shares=0):
+    # EV ($M) to equity value and price per share; no shares gives a price of 0
+    equity_value = np.asarray(enterprise_value) * 1e6 - debt + cash
+    shares = np.asarray(shares, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price = np.where(shares != 0, equity_value / np.where(shares != 0, shares, 1), 0.0)
+    return equity_value, price
+
+
+def closed_form_enterprise_value(last_revenue, assumptions, years=5, mid_year=False):
+    # With constant growth and drivers as a share of revenue, FCF_t = R0 * k * (1+g)^t,
+    # so the discounted FCFs are a geometric series in q = (1+g)/(1+d):
+    #   EV = R0 * k * (q * (1 - q^n) / (1 - q) + q^n * (1+tg) / (d - tg))
+    # O(1) per assumption set, whatever the horizon. Mid-year discounting moves
+    # every forecast cash flow half a year earlier, i.e. scales the series by (1+d)^0.5.
+    a = Assumptions(*(np.asarray(x, dtype=float) for x in assumptions))
+    k = a.ebit_margin - a.ebit_margin * a.tax_rate + a.dep_pct - a.capex_pct - a.nwc_pct
+    q = (1 + a.growth_rate) / (1 + a.discount_rate)
+    qn = (1 + a.growth_rate) ** years * terminal_factor(a.discount_rate, years)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # q == 1 makes every discounted FCF equal R0 * k
+        annuity = np.where(np.abs(1 - q) < 1e-12, years, q * (1 - qn) / (1 - q))
+        terminal = qn * (1 + a.terminal_growth) / (a.discount_rate - a.terminal_growth)
+    if mid_year:
+        annuity = annuity * np.sqrt(1 + a.discount_rate)
+    return last_revenue * k * (annuity + terminal)
+
+
+def free_cash_flow(last_revenue, assumptions, years=5, fade=None):
+    # Just the FCF line of the schedule, shaped like the assumptions + (years,);
+    # the discount rate and terminal growth aren't read
+    a = Assumptions(*(np.asarray(x, dtype=float) for x in assumptions))
+    growth_path, margin_path = fade_paths(a, fade, years)
+    last_revenue = _per_year(last_revenue)
+    if growth_path is None:
+        revenue = last_revenue * (1 + _per_year(a.growth_rate)) ** np.arange(1, years + 1)
+    else:
+        revenue = last_revenue * np.cumprod(1 + growth_path, axis=-1)
+    margin = _per_year(a.ebit_margin) if margin_path is None else margin_path
+    return revenue * (margin - margin * _per_year(a.tax_rate)
+                      + _per_year(a.dep_pct - a.capex_pct - a.nwc_pct))
+
+
+def explicit_enterprise_value(last_revenue, assumptions, years=5, mid_year=False, fade=None):
+    # EV from the year-by-year schedule, computing only the FCF line rather than
+    # the full project() breakdown
+    a = Assumptions(*(np.asarray(x, dtype=float) for x in assumptions))
+    return fcf_enterprise_value(free_cash_flow(last_revenue, a, years, fade), a.discount_rate, a.terminal_growth,
+                                mid_year)
+
+
+def value(last_revenue, assumptions, cash=0, debt=0, shares=0, years=5, mid_year=False, fade=None,
+          closed_form=True):
+    # The one valuation kernel: EV, equity value and price per share for every
+    # assumption set at once, shaped like the broadcast assumption fields.
+    # Constant-growth forecasts use the closed form; a multi-stage `fade` (or
+    # closed_form=False) sums the explicit year-by-year schedule, still vectorised
+    # over both the assumption sets and the years.
+    if closed_form and fade is None:
+        ev = closed_form_enterprise_value(last_revenue, assumptions, years, mid_year)
+    else:
+        ev = explicit_enterprise_value(last_revenue, assumptions, years, mid_year, fade)
+    return Valuation(ev, *equity_bridge(ev, cash, debt, shares))
+
+
+def solve(fn, target, lo, hi, fprime=None, tol=1e-9, max_iter=100):
+    # Vectorised root-finder: for every element, x in [lo, hi] with fn(x) == target,
+    # for fn monotonic on the bracket and evaluated on whole arrays at once. Bisects,
+    # or given the derivative `fprime` takes Newton steps, bisecting instead wherever
+    # a step would leave the bracket. Elements whose root isn't bracketed come back NaN.
+    target = np.asarray(target, dtype=float)
+    lo, hi = np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+    f_lo, f_hi = fn(lo) - target, fn(hi) - target
+    lo, hi, f_lo, f_hi = (a.copy() for a in np.broadcast_arrays(lo, hi, f_lo, f_hi))
+    bracketed = f_lo * f_hi <= 0
+    x = (lo + hi) / 2
+    for _ in range(max_iter):
+        f = fn(x) - target
+        same = np.sign(f) == np.sign(f_lo)
+        lo = np.where(same, x, lo)
+        f_lo = np.where(same, f, f_lo)
+        hi = np.where(same, hi, x)
+        step = (lo + hi) / 2
+        if fprime is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                newton = x - f / fprime(x)
+            step = np.where((newton >= lo) & (newton <= hi), newton, step)
+        done = (np.abs(step - x) < tol) | ~bracketed
+        x = step
+        if np.all(done):
+            break
+    return np.where(bracketed, x, np.nan)
+
+
+# Where to look for an implied value of each assumption that can be solved for
+IMPLIED_BOUNDS = {
+    "growth_rate": (-0.5, 1.0),
+    "ebit_margin": (-0.5, 1.0),
+}
+
+
+def implied(field, price, last_revenue, assumptions, cash=0, debt=0, shares=0, lo=None, hi=None, **kwargs):
+    # Reverse DCF: the value of one assumption (e.g. "growth_rate") at which the
+    # price per share equals `price`, holding the others. Every argument can be an
+    # array, e.g. one entry per ticker, and the whole batch is solved at once.
+    default_lo, default_hi = IMPLIED_BOUNDS[field]
+
+    def price_at(x):
+        return value(last_revenue, assumptions._replace(**{field: x}), cash, debt, shares, **kwargs).price_per_share
+
+    return solve(price_at, price, default_lo if lo is None else lo, default_hi if hi is None else hi)
+
+
+def implied_discount_rate(market_cap, last_revenue, assumptions, cash=0, debt=0, years=5, mid_year=False,
+                          fade=None, hi=1.0):
+    # Expected return priced in: the discount rate at which equity value equals the
+    # market cap ($), solved by safeguarded Newton; the assumptions' own discount
+    # rate isn't read. The FCF schedule doesn't depend on the rate, so it's
+    # projected once and each step only re-discounts it.
+    a = Assumptions(*(np.asarray(x, dtype=float) for x in assumptions))
+    fcf = free_cash_flow(last_revenue, a, years, fade)
+    t = discount_times(years, mid_year)
+    target = (np.asarray(market_cap, dtype=float) - cash + debt) / 1e6
+
+    def ev(d):
+        return fcf_enterprise_value(fcf, d, a.terminal_growth, mid_year)
+
+    def ev_slope(d):
+        # d/dd of (1+d)^-t is -t/(1+d) times the factor; the terminal value also
+        # has 1/(d - g) in it
+        _, tv_disc = terminal_value({"fcf": fcf}, d, a.terminal_growth)
+        return (-(t * fcf * discount_factors(d, years, mid_year)).sum(axis=-1) / (1 + d)
+                - tv_disc * (1 / (d - a.terminal_growth) + years / (1 + d)))
+
+    return solve(ev, target, a.terminal_growth + 1e-6, hi, fprime=ev_slope)
+
+
+def sensitivity_grid(last_revenue, assumptions, discount_rates, terminal_growths, cash=0, debt=0, shares=0,
+                     years=5, mid_year=False, fade=None):
+    # EV, equity value and price for every (discount rate, terminal growth) pair, in
+    # broadcast evaluations of at most CHUNK_SIZE cell-years; the assumptions' own
+    # discount rate and terminal growth are replaced. Cells with d <= g have no
+    # Gordon value and come back NaN.
+    d = np.asarray(discount_rates, dtype=float)
+    tg = np.asarray(terminal_growths, dtype=float)
+    rows = max(1, CHUNK_SIZE // max(len(tg) * years, 1))
+    outputs = np.empty((3, len(d), len(tg)))
+    for start in range(0, len(d), rows):
+        chunk = d[start:start + rows, None]
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            outputs[:, start:start + rows] = value(
+                last_revenue, assumptions._replace(discount_rate=chunk, terminal_growth=tg[None, :]),
+                cash, debt, shares, years=years, mid_year=mid_year, fade=fade,
+            )
+    valid = (d[:, None] > tg[None, :]) & np.isfinite(outputs[0])
+    return Grid(d, tg, *np.where(valid, outputs, np.nan))
+
+
+def _refine(coarse, activity, n):
+    # n points over the range of the coarse axis, spaced so every gap holds the same
+    # share of a density that is half uniform and half `activity` (one value per
+    # coarse point): points crowd where activity is high, but quiet stretches keep some
+    span = coarse[-1] - coarse[0]
+    if span <= 0:
+        return np.linspace(coarse[0], coarse[-1], n)
+    total = np.sum((activity[1:] + activity[:-1]) / 2 * np.diff(coarse))
+    density = 0.5 / span + (0.5 * activity / total if total > 0 else 0.5 / span)
+    cdf = np.r_[0, np.cumsum((density[1:] + density[:-1]) / 2 * np.diff(coarse))]
+    return np.interp(np.linspace(0, 1, n), cdf / cdf[-1], coarse)
+
+
+def heatmap_grid(last_revenue, assumptions, discount_range, growth_range, size=400, cash=0, debt=0, shares=0,
+                 years=5, mid_year=False, fade=None):
+    # size x size sensitivity grid over the two ranges, refined adaptively: a coarse
+    # pass measures how fast log EV moves along each axis, and the fine axes put
+    # more rows and columns there, i.e. along the d - g singularity
+    coarse = sensitivity_grid(last_revenue, assumptions, np.linspace(*discount_range, max(size // 8, 16)),
+                              np.linspace(*growth_range, max(size // 8, 16)),
+                              years=years, mid_year=mid_year, fade=fade)
+    log_ev = np.log(np.abs(coarse.enterprise_value))
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        # Rows or columns that are entirely masked have no activity
+        warnings.simplefilter("ignore", RuntimeWarning)
+        by_rate = np.nanmax(np.abs(np.gradient(log_ev, coarse.discount_rate, axis=0)), axis=1)
+        by_growth = np.nanmax(np.abs(np.gradient(log_ev, coarse.terminal_growth, axis=1)), axis=0)
+    return sensitivity_grid(last_revenue, assumptions,
+                            _refine(coarse.discount_rate, np.nan_to_num(by_rate, posinf=0), size),
+                            _refine(coarse.terminal_growth, np.nan_to_num(by_growth, posinf=0), size),
+                            cash, debt, shares, years=years, mid_year=mid_year, fade=fade)
+
+
+def grid_table(grid, output="enterprise_value"):
+    # Labeled frame of one grid output (see GRID_OUTPUTS) for display and export
+    return pd.DataFrame(getattr(grid, output) / GRID_OUTPUTS[output][1],
+                        index=[f"{d:.3f}" for d in grid.discount_rate],
+                        columns=[f"{g:.3f}" for g in grid.terminal_growth])
+
+
+def sensitivity_cube(last_revenue, assumptions, axes, years=5, mid_year=False, fade=None):
+    # EV for every combination of the values in `axes` ({assumption field: values}),
+    # the other assumptions held. The cells are evaluated as flat batches of at most
+    # CHUNK_SIZE cell-years, so memory stays bounded whatever the cube's size.
+    axes = {field: np.asarray(values, dtype=float) for field, values in axes.items()}
+    if len(axes) > CUBE_MAX_AXES:
+        raise ValueError(f"A sensitivity cube has at most {CUBE_MAX_AXES} axes, got {len(axes)}")
+    shape = tuple(len(values) for values in axes.values())
+    cells = int(np.prod(shape))
+    if cells > CUBE_MAX_CELLS:
+        raise ValueError(f"A sensitivity cube has at most {CUBE_MAX_CELLS:,} cells, got {cells:,}")
+
+    ev = np.empty(cells)
+    step = max(1, CHUNK_SIZE // years)
+    for start in range(0, cells, step):
+        index = np.unravel_index(np.arange(start, min(start + step, cells)), shape)
+        chunk = assumptions._replace(**{field: values[i] for (field, values), i in zip(axes.items(), index)})
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            ev[start:start + step] = value(last_revenue, chunk, years=years, mid_year=mid_year,
+                                           fade=fade).enterprise_value
+            ev[start:start + step][np.asarray(chunk.discount_rate <= chunk.terminal_growth)
+                                   | ~np.isfinite(ev[start:start + step])] = np.nan
+    return Cube(axes, ev.reshape(shape))
+
+
+def cube_slice(cube, rows, columns, at=None):
+    # Two axes of a cube as a frame (EV, $M), indexed by the axis values; every other
+    # axis is held at the position `at` gives it ({field: index}), the first by default
+    at = at or {}
+    fields = list(cube.axes)
+    values = cube.enterprise_value[tuple(slice(None) if f in (rows, columns) else at.get(f, 0) for f in fields)]
+    if fields.index(rows) > fields.index(columns):
+        values = values.T
+    return pd.DataFrame(values, index=pd.Index(cube.axes[rows], name=rows),
+                        columns=pd.Index(cube.axes[columns], name=columns))
+
+
+def tornado(last_revenue, assumptions, shock=0.01, cash=0, debt=0, shares=0, years=5, mid_year=False, fade=None):
+    # Each assumption moved down and up by `shock` (a rate, so 0.01 is one percentage
+    # point) with the others held: all 2 x k sets in one batched evaluation, shaped
+    # (k, 2) for (assumption in Assumptions order, down/up). Additive, so an input
+    # sitting at 0 still moves; the ones that can't go negative stop at 0. Sets
+    # with d <= g come back NaN.
+    base = np.array(assumptions, dtype=float)
+    k = len(base)
+    sets = np.tile(base, (k, 2, 1))
+    sets[np.arange(k), 0, np.arange(k)] -= shock
+    sets[np.arange(k), 1, np.arange(k)] += shock
+    for field in NON_NEGATIVE:
+        i = Assumptions._fields.index(field)
+        sets[..., i] = np.maximum(sets[..., i], 0)
+    shocked = Assumptions(*np.moveaxis(sets, -1, 0))
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        valuation = value(last_revenue, shocked, cash, debt, shares, years=years, mid_year=mid_year, fade=fade)
+    # A shock that takes d to or below g has no Gordon value: NaN, like the other batched paths
+    valid = (shocked.discount_rate > shocked.terminal_growth) & np.isfinite(valuation.enterprise_value)
+    return Valuation(*(np.where(valid, output, np.nan) for output in valuation))
+
+
+def batched_enterprise_value(last_revenue, assumptions, years=5, mid_year=False, fade=None):
+    # EV for n assumption sets given as fields of shape (n,) (or scalars), evaluated
+    # in flat batches of at most CHUNK_SIZE set-years so a long horizon or a fade
+    # never materialises an n x years array all at once. Sets with d <= g are NaN.
+    fields = [np.asarray(x, dtype=float) for x in assumptions]
+    n = max(x.size for x in fields)
+    ev = np.empty(n)
+    step = max(1, CHUNK_SIZE // years)
+    for start in range(0, n, step):
+        chunk = Assumptions(*(x if x.ndim == 0 else x[start:start + step] for x in fields))
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            ev[start:start + step] = value(last_revenue, chunk, years=years, mid_year=mid_year,
+                                           fade=fade).enterprise_value
+        ev[start:start + step][chunk.discount_rate <= chunk.terminal_growth] = np.nan
+    return ev
+
+
+def monte_carlo(last_revenue, assumptions, paths=1000, growth_sd=0.02, margin_sd=0.03, seed=42, years=5,
+                mid_year=False, fade=None):
+    # EV for `paths` draws of revenue growth and EBIT margin, normal around the
+    # assumptions' values, the rest held. Draws come from a private generator, so
+    # the same seed gives the same paths without touching NumPy's global state.
+    rng = np.random.RandomState(seed)
+    growth = rng.normal(assumptions.growth_rate, growth_sd, paths)
+    margin = rng.normal(assumptions.ebit_margin, margin_sd, paths)
+    return batched_enterprise_value(last_revenue, assumptions._replace(growth_rate=growth, ebit_margin=margin),
+                                    years, mid_year, fade)
+
+
+def sobol_indices(last_revenue, assumptions, spread=0.01, samples=8192, seed=42, years=5, mid_year=False,
+                  fade=None):
+    # First-order and total Sobol indices of EV for each assumption, each drawn
+    # uniformly within +/- `spread` of its value (a rate, so 0.01 is one percentage
+    # point, and an input at 0 still varies; NON_NEGATIVE ones are drawn from 0
+    # up when the range would go below). Saltelli's design: two
+    # sample matrices A and B plus, per assumption, A with that column taken from B;
+    # all samples x (k + 2) sets are evaluated as flat batches of at most CHUNK_SIZE
+    # cell-years. Estimators are Saltelli (2010) for first order, Jansen for total,
+    # on EV centred on its sample mean.
+    # Draws with no valid value (d <= g) are dropped.
+    base = np.array(assumptions, dtype=float)
+    k = len(base)
+    rng = np.random.default_rng(seed)
+    low, high = base - spread, base + spread
+    for field in NON_NEGATIVE:
+        i = Assumptions._fields.index(field)
+        low[i] = max(low[i], 0)
+    a, b = (rng.uniform(low, high, (samples, k)) for _ in range(2))
+    design = np.repeat(a[None], k + 2, axis=0)
+    design[1] = b
+    design[2 + np.arange(k), :, np.arange(k)] = b.T
+    design = design.reshape(-1, k)
+
+    ev = batched_enterprise_value(last_revenue, Assumptions(*design.T), years, mid_year, fade).reshape(k + 2, samples)
+    ev = ev[:, np.isfinite(ev).all(axis=0)]
+    # Centred first: otherwise E[EV]^2 swamps both the products and the variance
+    ev = ev - np.mean(ev[:2])
+    f_a, f_b, f_ab = ev[0], ev[1], ev[2:]
+    variance = np.var(np.r_[f_a, f_b])
+    return pd.DataFrame({
+        "First-order": np.mean(f_b * (f_ab - f_a), axis=1) / variance,
+        "Total": 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance,
+    }, index=Assumptions._fields)
+
+
+def base_revenue(data):
+    # Revenue the forecast grows from ($M), from a get_data() tuple
+    income = data[0]
+    revenue_series = income['Total Revenue'].dropna()
+    return float(revenue_series.iloc[-1] / 1e6)  # in millions
+
+
+def bridge(data):
+    # (cash, debt, shares) for the equity bridge, from a get_data() tuple
+    balance, info = data[1], data[3]
+    cash = balance['Cash'].iloc[0] if 'Cash' in balance.columns else 0
+    debt = balance['Long Term Debt'].iloc[0] if 'Long Term Debt' in balance.columns else 0
+    return float(cash), float(debt), float(info.get('sharesOutstanding', 0) or 0)
+
+
+def market(data):
+    # (current price, market cap), the cap implied by the price when not reported
+    info = data[3]
+    price = float(info.get('currentPrice', 0) or 0)
+    shares = float(info.get('sharesOutstanding', 0) or 0)
+    return price, float(info.get('marketCap', 0) or 0) or price * shares
+
+
+def projection_table(schedule, start_year=2024):
+    # Display frame for the schedule; only built at the edge, never in the math
+    years = start_year + np.arange(len(schedule["fcf"]))
+    return pd.DataFrame({"Year": years, **{label: schedule[key] for key, label in PROJECTION_COLUMNS.items()}})
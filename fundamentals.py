@@ -0,0 +1,411 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from providers import PAYLOADS, STATEMENTS, CircuitBreaker, ResilientProvider, make_provider
+from snapshot import Snapshot
+
+# Where fetched fundamentals live between runs, and how long they stay fresh (seconds)
+CACHE_DIR = Path(os.environ.get("DCF_CACHE_DIR", ".dcf_cache"))
+CACHE_TTL = float(os.environ.get("DCF_CACHE_TTL", 24 * 60 * 60))
+# Serve expired payloads up to this age (seconds) while they refresh in the background
+STALE_WHILE_REVALIDATE = os.environ.get("DCF_STALE_WHILE_REVALIDATE", "1") != "0"
+CACHE_MAX_STALE = float(os.environ.get("DCF_CACHE_MAX_STALE", 30 * 24 * 60 * 60))
+# Where fundamentals come from: "yfinance", "fixture:<dir>" or "synthetic[:<seed>]"
+PROVIDER = os.environ.get("DCF_PROVIDER", "yfinance")
+# Prebuilt universe snapshot (see snapshot.py) served ahead of the cache and provider
+SNAPSHOT = os.environ.get("DCF_SNAPSHOT")
+# Each attempt's timeout, retries after the first attempt, and when the circuit breaker trips
+CALL_TIMEOUT = float(os.environ.get("DCF_CALL_TIMEOUT", 8))
+CALL_RETRIES = int(os.environ.get("DCF_CALL_RETRIES", 2))
+# Backoff before retry n is jittered up to min(CALL_MAX_BACKOFF, CALL_BACKOFF * 2^n) seconds
+CALL_BACKOFF = 0.5
+CALL_MAX_BACKOFF = 8.0
+# Overall deadline (seconds) for fetching a ticker's payloads, after which the rest are reported
+# missing; by default long enough for every attempt and backoff of a call
+FETCH_TIMEOUT = float(os.environ.get(
+    "DCF_FETCH_TIMEOUT",
+    CALL_TIMEOUT * (CALL_RETRIES + 1) + sum(min(CALL_MAX_BACKOFF, CALL_BACKOFF * 2 ** n) for n in range(CALL_RETRIES)),
+))
+BREAKER_FAILURES = int(os.environ.get("DCF_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("DCF_BREAKER_RESET", 60))
+
+log = logging.getLogger(__name__)
+
+
+class FundamentalsCache:
+    # One directory per ticker holding a Parquet file per statement and info.json.
+    # Each payload ages on its own, from the mtime of its file.
+
+    def __init__(self, root=CACHE_DIR, ttl=CACHE_TTL, ttls=None):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.ttls = {t.upper(): v for t, v in (ttls or {}).items()}
+
+    def set_ttl(self, ticker, ttl):
+        self.ttls[ticker.upper()] = ttl
+
+    def ttl_for(self, ticker):
+        return self.ttls.get(ticker.upper(), self.ttl)
+
+    def path(self, ticker, name=None):
+        folder = self.root / ticker.upper()
+        if name is None:
+            return folder
+        return folder / ("info.json" if name == "info" else f"{name}.parquet")
+
+    def age(self, ticker, name):
+        try:
+            return time.time() - self.path(ticker, name).stat().st_mtime
+        except OSError:
+            return None
+
+    def is_fresh(self, ticker, name, max_age=None):
+        age = self.age(ticker, name)
+        return age is not None and age < (self.ttl_for(ticker) if max_age is None else max_age)
+
+    def load(self, ticker, name, fields=None, max_age=None):
+        # Payload no older than `max_age` (the ticker's TTL by default), narrowed to
+        # `fields` when given, or None
+        if not self.is_fresh(ticker, name, max_age):
+            return None
+        path = self.path(ticker, name)
+        try:
+            if name == "info":
+                return _select(json.loads(path.read_text()), fields)
+            if fields is None:
+                return pd.read_parquet(path)
+            # Only decode the requested columns
+            present = set(pq.read_schema(path).names)
+            return pd.read_parquet(path, columns=[f for f in fields if f in present])
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, write):
+        # Write beside the final name and swap it in, so readers never see half a file
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        write(tmp)
+        os.replace(tmp, path)
+
+    def store(self, ticker, payloads):
+        self.path(ticker).mkdir(parents=True, exist_ok=True)
+        for name, payload in payloads.items():
+            if name == "info":
+                self._write(self.path(ticker, name), lambda p: p.write_text(json.dumps(payload, default=str)))
+            else:
+                self._write(self.path(ticker, name), payload.to_parquet)
+        financials = payloads.get("financials")
+        if financials is not None and len(financials.index):
+            meta = {"latest_period": pd.Timestamp(financials.index.max()).isoformat()}
+            self._write(self.path(ticker) / "meta.json", lambda p: p.write_text(json.dumps(meta)))
+
+    def latest_period(self, ticker):
+        # Most recent fiscal period in the cached income statement
+        try:
+            meta = json.loads((self.path(ticker) / "meta.json").read_text())
+        except (OSError, ValueError):
+            return None
+        return pd.Timestamp(meta["latest_period"])
+
+    def touch(self, ticker, names):
+        # Mark cached payloads as just fetched without rewriting them
+        for name in names:
+            try:
+                os.utime(self.path(ticker, name))
+            except OSError:
+                pass
+
+    def invalidate(self, ticker=None):
+        # Drop one ticker, or the whole cache when no ticker is given
+        shutil.rmtree(self.path(ticker) if ticker else self.root, ignore_errors=True)
+
+
+class SingleFlight:
+    # Collapses concurrent calls with the same key into one; every caller gets
+    # the leader's result (or exception)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+cache = FundamentalsCache()
+flight = SingleFlight()
+provider = ResilientProvider(
+    make_provider(PROVIDER),
+    timeout=CALL_TIMEOUT,
+    retries=CALL_RETRIES,
+    backoff=CALL_BACKOFF,
+    max_backoff=CALL_MAX_BACKOFF,
+    breaker=CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET),
+)
+snapshot = Snapshot(SNAPSHOT) if SNAPSHOT else None
+
+# Shared by all sessions; a hung call only ties up its own worker
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fundamentals")
+# Background revalidation runs fetch(), which itself waits on _pool, so it gets its own workers
+_refresher = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fundamentals-refresh")
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+
+
+def _empty(name):
+    return {} if name == "info" else pd.DataFrame()
+
+
+def _select(payload, fields):
+    # Narrow a payload to the fields a model declared; None keeps everything
+    if fields is None:
+        return payload
+    if isinstance(payload, dict):
+        return {k: payload[k] for k in fields if k in payload}
+    return payload[[f for f in fields if f in payload.columns]]
+
+
+def _fetch_shared(source, ticker, name, refresh, merge=False):
+    # One provider call per (ticker, payload) in the whole process. The leader
+    # caches the payload before waking waiters, and rechecks the cache first in
+    # case another flight for the same key landed since the caller looked. With
+    # `merge`, a statement is merged into the cached copy before the one write.
+    def load():
+        payload = None if refresh else cache.load(ticker, name)
+        if payload is not None:
+            return payload
+        payload = source.fetch(ticker, name)
+        if merge:
+            payload = _merge(payload, cache.load(ticker, name, max_age=float("inf")))
+        cache.store(ticker, {name: payload})
+        return payload
+    return flight.do((ticker.upper(), name), load)
+
+
+def fetch(ticker, names=PAYLOADS, timeout=FETCH_TIMEOUT, refresh=True, source=None, merge=False):
+    # Fetch and cache the payloads in `names` at once; anything failed or still
+    # running after the timeout is left out and listed in `missing`
+    source = source or provider
+    futures = {name: _pool.submit(_fetch_shared, source, ticker, name, refresh, merge) for name in names}
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    data, missing, errors = {}, [], []
+    for name, future in futures.items():
+        if future in done and future.exception() is None:
+            data[name] = future.result()
+            continue
+        if future in done:
+            errors.append(future.exception())
+        else:
+            future.cancel()
+            errors.append(TimeoutError(f"{name} for {ticker} timed out after {timeout:g}s"))
+        missing.append(name)
+    if errors and not data:
+        raise errors[0]
+    return data, missing
+
+
+def revalidate(ticker, names=PAYLOADS):
+    # Refresh payloads in the background; a payload already queued is not queued twice
+    ticker = ticker.upper()
+    with _revalidating_lock:
+        names = [n for n in names if (ticker, n) not in _revalidating]
+        _revalidating.update((ticker, n) for n in names)
+    if not names:
+        return
+
+    def run():
+        try:
+            # refresh=False: skip anything another session refreshed meanwhile
+            _, missing = fetch(ticker, names, refresh=False)
+            if missing:
+                log.warning("Background refresh of %s missed: %s", ticker, ", ".join(missing))
+        except Exception:
+            log.exception("Background refresh of %s failed", ticker)
+        finally:
+            with _revalidating_lock:
+                _revalidating.difference_update((ticker, n) for n in names)
+
+    _refresher.submit(run)
+
+
+def _from_snapshot(ticker, names):
+    # The snapshot answers for the tickers it covers until the cache holds a copy of
+    # one of their payloads fetched after it was built (Refresh Data, revalidation,
+    # refresh_universe); from then on the cache, with its TTL, takes over
+    if snapshot is None or ticker not in snapshot:
+        return False
+    ages = [age for age in (cache.age(ticker, name) for name in names) if age is not None]
+    return not ages or time.time() - min(ages) <= snapshot.built_at
+
+
+def get_data(ticker, fields=None, refresh=False, stale_while_revalidate=STALE_WHILE_REVALIDATE):
+    # `fields` is a model's manifest, {payload: [field, ...] or None}. Payloads it
+    # doesn't list are neither fetched nor read and come back empty.
+    names = PAYLOADS if fields is None else [n for n in PAYLOADS if n in fields]
+    if not refresh and _from_snapshot(ticker, names):
+        return snapshot.get_data(ticker, fields)
+
+    fields = fields or {}
+
+    data = {}
+    if not refresh:
+        stale = []
+        for name in names:
+            hit = cache.load(ticker, name, fields.get(name))
+            if hit is None and stale_while_revalidate:
+                hit = cache.load(ticker, name, fields.get(name), max_age=CACHE_MAX_STALE)
+                if hit is not None:
+                    stale.append(name)
+            if hit is not None:
+                data[name] = hit
+        if stale:
+            # Answer now with the expired copy; the next rerun picks up the refreshed one
+            revalidate(ticker, stale)
+
+    todo = [n for n in names if n not in data]
+    if todo:
+        error = None
+        try:
+            fetched, missing = fetch(ticker, todo, refresh=refresh)
+        except Exception as exc:
+            fetched, missing, error = {}, todo, exc
+        data.update({name: _select(payload, fields.get(name)) for name, payload in fetched.items()})
+        if missing:
+            # Serve what arrived, falling back to the last copy we have however old;
+            # the missing payloads are retried on the next call
+            log.warning("Partial fundamentals for %s, missing: %s", ticker, ", ".join(missing))
+            for name in missing:
+                hit = cache.load(ticker, name, fields.get(name), max_age=float("inf"))
+                if hit is None and snapshot is not None and ticker in snapshot:
+                    hit = _select(snapshot.fetch(ticker, name), fields.get(name))
+                if hit is not None:
+                    data[name] = hit
+        if error is not None and not data:
+            raise error
+
+    return tuple(data.get(name, _empty(name)) for name in PAYLOADS)
+
+
+class RateLimiter:
+    # Token bucket shared by worker threads: at most `rate` acquisitions per second
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            time.sleep(wait_for)
+
+
+def _run_batch(fn, tickers, workers, rate, progress):
+    # Run fn(ticker) over a ticker list with at most `workers` at once and, with
+    # `rate`, no more than `rate` starting per second. progress(done, total, ticker)
+    # is called as each finishes. Returns {ticker: (result, error)}.
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    limiter = RateLimiter(rate) if rate else None
+    results, done = {}, 0
+
+    def run(ticker):
+        if limiter is not None:
+            limiter.acquire()
+        return fn(ticker)
+
+    # Own pool: fn usually waits on _pool, so running it there could starve it
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        futures = {pool.submit(run, t): t for t in tickers}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            error = future.exception()
+            results[ticker] = (None if error else future.result(), error)
+            done += 1
+            if progress is not None:
+                progress(done, len(tickers), ticker)
+    return results
+
+
+def prefetch(tickers, fields=None, workers=8, rate=None, progress=None):
+    # Warm the cache for a watchlist; see _run_batch for the other arguments.
+    # Returns {ticker: error or None}.
+    def load(ticker):
+        get_data(ticker, fields, stale_while_revalidate=False)
+
+    return {t: error for t, (_, error) in _run_batch(load, tickers, workers, rate, progress).items()}
+
+
+def _merge(new, old):
+    # The fresh pull wins; line items it lacks for a period are kept from the old copy
+    if old is None or not len(new.index):
+        return new
+    columns = [*new.columns, *old.columns.difference(new.columns)]
+    return new.combine_first(old).loc[new.index, columns]
+
+
+def refresh_ticker(ticker, fields=None, source=None):
+    # Re-pull the statements a manifest lists (by default, the ones cached for the
+    # ticker) only when the provider reports a fiscal period newer than the cached
+    # one; otherwise just restart the cached copies' TTL. Returns True when the
+    # statements were re-pulled.
+    source = source or provider
+    if fields is None:
+        names = [name for name in STATEMENTS if cache.age(ticker, name) is not None]
+    else:
+        names = [name for name in STATEMENTS if name in fields]
+    if not names:
+        return False
+    known = cache.latest_period(ticker)
+    latest = source.latest_period(ticker)
+    if known is not None and latest is not None and pd.Timestamp(latest) <= known:
+        cache.touch(ticker, names)
+        return False
+
+    _, missing = fetch(ticker, names, refresh=True, source=source, merge=True)
+    if missing:
+        log.warning("Refresh of %s missed: %s", ticker, ", ".join(missing))
+    return True
+
+
+def refresh_universe(tickers, fields=None, workers=8, rate=None, progress=None):
+    # Nightly refresh of a universe; returns the tickers whose statements were re-pulled
+    results = _run_batch(lambda ticker: refresh_ticker(ticker, fields), tickers, workers, rate, progress)
+    for ticker, (_, error) in results.items():
+        if error is not None:
+            log.warning("Couldn't refresh %s: %r", ticker, error)
+    return [ticker for ticker, (updated, _) in results.items() if updated]
@@ -0,0 +1,227 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import dcf
+
+# Revenue-driven assumptions, in dcf.Assumptions order
+DRIVERS = ("growth_rate", "ebit_margin", "tax_rate", "capex_pct", "dep_pct", "nwc_pct")
+# Everything about the forecast shape that isn't a single-number assumption
+HORIZON = ("horizon", "mid_year", "fade")
+# Axes of the sensitivity table
+SENSITIVITY_DISCOUNTS = np.arange(0.07, 0.105, 0.005)
+SENSITIVITY_GROWTHS = np.arange(0.01, 0.045, 0.005)
+
+
+class _Same:
+    # Token for an unhashable input: equal only to the very same object, which it
+    # keeps alive so the object's id can't be handed to a new one
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, _Same) and other.value is self.value
+
+
+_NAN = object()
+
+
+def _nan_equal(value):
+    # NaN never equals itself; swap it for a marker that does, so a NaN result
+    # (e.g. missing cash) counts as unchanged
+    if isinstance(value, float) and value != value:
+        return _NAN
+    if isinstance(value, tuple):
+        return tuple(_nan_equal(v) for v in value)
+    return value
+
+
+def _token(value, fallback):
+    # Hashable results (floats, tuples of floats) stand for themselves, so a stage that
+    # recomputes to the same value doesn't invalidate anything downstream of it
+    try:
+        hash(value)
+    except TypeError:
+        return fallback
+    return ("=", _nan_equal(value))
+
+
+class Pipeline:
+    # Named, memoised stages wired to their inputs. Getting a stage re-runs it only
+    # when one of its dependencies (an input or an upstream stage) changed since its
+    # last run.
+
+    def __init__(self):
+        self._stages = {}
+        self._memo = {}
+        self.computed = []
+
+    def stage(self, *deps):
+        def register(fn):
+            self._stages[fn.__name__] = (fn, deps)
+            return fn
+        return register
+
+    def run(self, inputs, *names):
+        # Values of the named stages for these inputs; self.computed lists what actually ran
+        self.computed = []
+        resolved = {}
+        values = [self._resolve(name, inputs, resolved)[1] for name in names]
+        return values[0] if len(values) == 1 else values
+
+    def _resolve(self, name, inputs, resolved):
+        if name in resolved:
+            return resolved[name]
+        if name not in self._stages:
+            # Unhashable inputs (frames) count as changed whenever a new object is passed
+            value = inputs[name]
+            resolved[name] = (_token(value, _Same(value)), value)
+            return resolved[name]
+
+        fn, deps = self._stages[name]
+        args = [self._resolve(dep, inputs, resolved) for dep in deps]
+        key = tuple(token for token, _ in args)
+        memo = self._memo.get(name)
+        if memo is None or memo[0] != key:
+            value = fn(*(value for _, value in args))
+            memo = self._memo[name] = (key, value, memo[2] + 1 if memo else 0)
+            self.computed.append(name)
+        _, value, version = memo
+        resolved[name] = (_token(value, (name, version)), value)
+        return resolved[name]
+
+
+def build_pipeline():
+    # The DCF as a graph: fundamentals -> base revenue -> projections -> terminal
+    # value -> EV -> equity bridge, with the analytics hanging off the pieces they
+    # read. The fundamentals input is a fresh get_data() tuple on every run; the
+    # stages reading it return plain numbers, which stop the change there unless
+    # the numbers actually moved.
+    pipe = Pipeline()
+
+    # The same readers screen.py uses on a whole universe
+    pipe.stage("fundamentals")(dcf.base_revenue)
+    pipe.stage("fundamentals")(dcf.bridge)
+    pipe.stage("fundamentals")(dcf.market)
+
+    @pipe.stage("base_revenue", *DRIVERS, "discount_rate", *HORIZON, "start_year")
+    def projections(last_revenue, *args):
+        *drivers, discount_rate, horizon, mid_year, fade, start_year = args
+        growth_path, margin_path = dcf.fade_paths(dcf.Assumptions(*drivers, discount_rate, None), fade, horizon)
+        schedule = dcf.project(last_revenue, *drivers, discount_rate, years=horizon, mid_year=mid_year,
+                               growth_path=growth_path, margin_path=margin_path)
+        return schedule, dcf.projection_table(schedule, start_year=start_year)
+
+    @pipe.stage("projections", "discount_rate", "terminal_growth")
+    def terminal_value(projections, discount_rate, terminal_growth):
+        tv, tv_disc = dcf.terminal_value(projections[0], discount_rate, terminal_growth)
+        return float(tv), float(tv_disc)
+
+    @pipe.stage("projections", "terminal_value")
+    def enterprise_value(projections, terminal_value):
+        return float(projections[0]["discounted_fcf"].sum() + terminal_value[1])
+
+    @pipe.stage("enterprise_value", "bridge")
+    def equity(enterprise_value, bridge):
+        equity_value, price = dcf.equity_bridge(enterprise_value, *bridge)
+        return float(equity_value), float(price)
+
+    @pipe.stage("base_revenue", "bridge", *DRIVERS[2:], "discount_rate", "terminal_growth", *HORIZON)
+    def scenarios(last_revenue, bridge, *args):
+        *rest, horizon, mid_year, fade = args
+        growths, margins = (np.array(v) for v in zip(*dcf.SCENARIOS.values()))
+        compared = dcf.value(last_revenue, dcf.Assumptions(growths, margins, *rest), *bridge,
+                             years=horizon, mid_year=mid_year, fade=fade)
+        return pd.DataFrame({
+            "Growth": growths,
+            "EBIT Margin": margins,
+            "EV ($B)": compared.enterprise_value / 1e3,
+            "Equity Value ($B)": compared.equity_value / 1e9,
+            "Price per Share": compared.price_per_share,
+        }, index=list(dcf.SCENARIOS))
+
+    # The grid varies discount rate and terminal growth itself, so neither slider touches it
+    @pipe.stage("base_revenue", "bridge", *DRIVERS, *HORIZON)
+    def sensitivity(last_revenue, bridge, *args):
+        *drivers, horizon, mid_year, fade = args
+        return dcf.sensitivity_grid(last_revenue, dcf.Assumptions(*drivers, None, None),
+                                    SENSITIVITY_DISCOUNTS, SENSITIVITY_GROWTHS, *bridge,
+                                    years=horizon, mid_year=mid_year, fade=fade)
+
+    @pipe.stage("base_revenue", "bridge", *DRIVERS, *HORIZON, "heatmap_size", "heatmap_discounts", "heatmap_growths")
+    def heatmap(last_revenue, bridge, *args):
+        *drivers, horizon, mid_year, fade, size, discount_range, growth_range = args
+        return dcf.heatmap_grid(last_revenue, dcf.Assumptions(*drivers, None, None), discount_range, growth_range,
+                                size, *bridge, years=horizon, mid_year=mid_year, fade=fade)
+
+    # cube_axes is a tuple of (assumption, low, high, steps)
+    @pipe.stage("base_revenue", *DRIVERS, "discount_rate", "terminal_growth", *HORIZON, "cube_axes")
+    def cube(last_revenue, *args):
+        *assumptions, horizon, mid_year, fade, axes = args
+        return dcf.sensitivity_cube(last_revenue, dcf.Assumptions(*assumptions),
+                                    {field: np.linspace(low, high, steps) for field, low, high, steps in axes},
+                                    years=horizon, mid_year=mid_year, fade=fade)
+
+    @pipe.stage("base_revenue", "bridge", *DRIVERS, "discount_rate", "terminal_growth", *HORIZON, "tornado_shock")
+    def tornado(last_revenue, bridge, *args):
+        *assumptions, horizon, mid_year, fade, shock = args
+        shocked = dcf.tornado(last_revenue, dcf.Assumptions(*assumptions), shock, *bridge,
+                              years=horizon, mid_year=mid_year, fade=fade)
+        return pd.DataFrame({
+            "Assumption": np.repeat(dcf.Assumptions._fields, 2),
+            "Shock": np.tile(["Down", "Up"], len(dcf.Assumptions._fields)),
+            "EV ($B)": shocked.enterprise_value.ravel() / 1e3,
+            "Price per Share": shocked.price_per_share.ravel(),
+        })
+
+    @pipe.stage("base_revenue", *DRIVERS, "discount_rate", "terminal_growth", *HORIZON, "simulations")
+    def monte_carlo(last_revenue, *args):
+        *assumptions, horizon, mid_year, fade, simulations = args
+        return dcf.monte_carlo(last_revenue, dcf.Assumptions(*assumptions), simulations,
+                               years=horizon, mid_year=mid_year, fade=fade)
+
+    # Growth and, separately, EBIT margin that would make the model price equal the
+    # market price with everything else as set; NaN when no value in range does
+    @pipe.stage("base_revenue", "bridge", "market", *DRIVERS, "discount_rate", "terminal_growth", *HORIZON)
+    def reverse_dcf(last_revenue, bridge, market, *args):
+        *assumptions, horizon, mid_year, fade = args
+        current_price = market[0]
+        if not current_price or not bridge[2]:
+            return np.nan, np.nan
+        assumptions = dcf.Assumptions(*assumptions)
+        return tuple(
+            float(dcf.implied(field, current_price, last_revenue, assumptions, *bridge,
+                              years=horizon, mid_year=mid_year, fade=fade))
+            for field in ("growth_rate", "ebit_margin")
+        )
+
+    # Discount rate at which equity value meets the market cap; the slider's rate isn't read
+    @pipe.stage("base_revenue", "bridge", "market", *DRIVERS, "terminal_growth", *HORIZON)
+    def implied_return(last_revenue, bridge, market, *args):
+        *drivers, terminal_growth, horizon, mid_year, fade = args
+        if not market[1]:
+            return np.nan
+        assumptions = dcf.Assumptions(*drivers, np.nan, terminal_growth)
+        return float(dcf.implied_discount_rate(market[1], last_revenue, assumptions, *bridge[:2],
+                                               years=horizon, mid_year=mid_year, fade=fade))
+
+    @pipe.stage("base_revenue", *DRIVERS, "discount_rate", "terminal_growth", *HORIZON, "sobol_spread",
+                "sobol_samples")
+    def sobol(last_revenue, *args):
+        *assumptions, horizon, mid_year, fade, spread, samples = args
+        return dcf.sobol_indices(last_revenue, dcf.Assumptions(*assumptions), spread, samples,
+                                 years=horizon, mid_year=mid_year, fade=fade)
+
+    @pipe.stage("projections", "sensitivity")
+    def excel(projections, sensitivity):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+            projections[1].to_excel(writer, sheet_name="Projections", index=False)
+            dcf.grid_table(sensitivity).round(2).to_excel(writer, sheet_name="Sensitivity Table")
+        return buffer.getvalue()
+
+    return pipe
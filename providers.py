@@ -0,0 +1,260 @@
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+log = logging.getLogger(__name__)
+
+# Statement payloads in the order get_data returns them, followed by info
+STATEMENTS = ("financials", "balance_sheet", "cashflow")
+PAYLOADS = (*STATEMENTS, "info")
+
+
+class Provider:
+    # A source of fundamentals. Statements come back the way get_data returns them:
+    # one row per period (most recent first), one column per line item.
+
+    def statement(self, ticker, name):
+        raise NotImplementedError
+
+    def info(self, ticker):
+        raise NotImplementedError
+
+    def fetch(self, ticker, name):
+        return self.info(ticker) if name == "info" else self.statement(ticker, name)
+
+    def latest_period(self, ticker):
+        # End of the most recent fiscal year reported; providers with a cheaper
+        # signal than downloading the income statement override this
+        periods = self.statement(ticker, "financials").index
+        return periods.max() if len(periods) else None
+
+
+class YFinanceProvider(Provider):
+
+    def statement(self, ticker, name):
+        return getattr(yf.Ticker(ticker), name).T
+
+    def info(self, ticker):
+        return yf.Ticker(ticker).info
+
+    def latest_period(self, ticker):
+        end = self.info(ticker).get("lastFiscalYearEnd")
+        return pd.Timestamp(end, unit="s").normalize() if end else super().latest_period(ticker)
+
+
+class FixtureProvider(Provider):
+    # Reads the fundamentals cache layout: <root>/<TICKER>/<statement>.parquet and info.json,
+    # so a warmed cache directory doubles as an offline fixture set
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def statement(self, ticker, name):
+        return pd.read_parquet(self.root / ticker.upper() / f"{name}.parquet")
+
+    def info(self, ticker):
+        return json.loads((self.root / ticker.upper() / "info.json").read_text())
+
+
+class SyntheticProvider(Provider):
+    # Deterministic fake fundamentals for any ticker, for load tests and benchmarks.
+    # `latency` (seconds) is slept on every call to stand in for the network.
+
+    SECTORS = ["Technology", "Healthcare", "Industrials", "Consumer Cyclical", "Energy", "Utilities"]
+
+    def __init__(self, seed=0, periods=4, latency=0.0):
+        self.seed = seed
+        self.periods = periods
+        self.latency = latency
+
+    @staticmethod
+    def tickers(n):
+        return [f"SYN{i:05d}" for i in range(n)]
+
+    def _rng(self, ticker):
+        return np.random.default_rng([self.seed, zlib.crc32(ticker.upper().encode())])
+
+    def _company(self, ticker):
+        rng = self._rng(ticker)
+        revenue = rng.lognormal(np.log(5e9), 1.5)
+        growth = rng.normal(0.06, 0.05, self.periods)
+        # Oldest period first, then flipped to most recent first like yfinance
+        revenues = revenue * np.cumprod(1 + growth)[::-1]
+        margin = np.clip(rng.normal(0.18, 0.08), 0.02, 0.45)
+        shares = revenue / rng.uniform(20, 200)
+        price = revenue * margin * rng.uniform(8, 30) / shares
+        end = pd.Timestamp(year=2024, month=12, day=31)
+        periods = pd.DatetimeIndex([end - pd.DateOffset(years=i) for i in range(self.periods)])
+        return rng, revenues, margin, shares, price, periods
+
+    def statement(self, ticker, name):
+        time.sleep(self.latency)
+        rng, revenues, margin, _, _, periods = self._company(ticker)
+        if name == "financials":
+            ebit = revenues * margin
+            columns = {
+                "Total Revenue": revenues,
+                "EBIT": ebit,
+                "Net Income": ebit * (1 - 0.21),
+            }
+        elif name == "balance_sheet":
+            columns = {
+                "Cash": revenues * rng.uniform(0.05, 0.4),
+                "Long Term Debt": revenues * rng.uniform(0.0, 0.8),
+                "Total Assets": revenues * rng.uniform(1.0, 2.5),
+            }
+        elif name == "cashflow":
+            capex = revenues * rng.uniform(0.02, 0.12)
+            columns = {
+                "Capital Expenditure": -capex,
+                "Free Cash Flow": revenues * margin * 0.8 - capex,
+            }
+        else:
+            raise KeyError(name)
+        return pd.DataFrame(columns, index=periods)
+
+    def info(self, ticker):
+        time.sleep(self.latency)
+        rng, _, _, shares, price, _ = self._company(ticker)
+        return {
+            "longName": f"{ticker.upper()} Synthetic Corp",
+            "sector": self.SECTORS[int(rng.integers(len(self.SECTORS)))],
+            "marketCap": float(shares * price),
+            "sharesOutstanding": float(shares),
+            "currentPrice": float(price),
+        }
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class EmptyPayload(Exception):
+    # The provider answered with nothing: yfinance does this instead of raising
+    # when a request fails (and for unknown tickers)
+    pass
+
+
+class CircuitBreaker:
+    # Opens after `failures` consecutive failures and fails fast for `reset_after`
+    # seconds; then lets one trial call through, which closes it again on success
+
+    def __init__(self, failures=5, reset_after=60.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._count = 0
+        self._opened_at = None
+        self._trial = False
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._count, self._opened_at = 0, None
+                return
+            self._count += 1
+            if self._opened_at is not None or self._count >= self.failures:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class ResilientProvider(Provider):
+    # Wraps another provider with a per-attempt timeout, retries with jittered
+    # exponential backoff and a circuit breaker. Lookups that can't succeed on
+    # retry (unknown ticker, missing fixture) are raised straight away; empty
+    # payloads are failures like any other.
+
+    GIVE_UP = (KeyError, FileNotFoundError, NotImplementedError)
+
+    def __init__(self, inner, timeout=8.0, retries=2, backoff=0.5, max_backoff=8.0, breaker=None):
+        self.inner = inner
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="provider-call")
+
+    def _attempt(self, label, fn, *args):
+        # A hung call keeps its worker, but the caller moves on after `timeout`
+        future = self._pool.submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise TimeoutError(f"{label} took longer than {self.timeout:g}s") from None
+
+    def _call(self, label, fn, *args):
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise ProviderUnavailable(f"Data provider is failing, not calling it for {label}")
+            try:
+                result = self._attempt(label, fn, *args)
+            except self.GIVE_UP:
+                self.breaker.record(True)
+                raise
+            except Exception as exc:
+                self.breaker.record(False)
+                if attempt == self.retries:
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                log.info("Retrying %s in %.2fs after %r", label, delay, exc)
+                time.sleep(delay)
+            else:
+                self.breaker.record(True)
+                return result
+
+    def _fetch_some(self, ticker, name):
+        payload = self.inner.fetch(ticker, name)
+        if len(payload) == 0:
+            raise EmptyPayload(f"{name} for {ticker} came back empty")
+        return payload
+
+    def fetch(self, ticker, name):
+        # An empty statement or info counts as a failed call, so it is retried and never
+        # replaces a cached copy
+        return self._call(f"{ticker} {name}", self._fetch_some, ticker, name)
+
+    def latest_period(self, ticker):
+        return self._call(f"{ticker} latest period", self.inner.latest_period, ticker)
+
+    def statement(self, ticker, name):
+        return self.fetch(ticker, name)
+
+    def info(self, ticker):
+        return self.fetch(ticker, "info")
+
+
+def make_provider(spec):
+    # "yfinance", "fixture:<dir>" or "synthetic[:<seed>]"
+    kind, _, arg = spec.partition(":")
+    if kind == "yfinance":
+        return YFinanceProvider()
+    if kind == "fixture":
+        return FixtureProvider(arg)
+    if kind == "synthetic":
+        return SyntheticProvider(seed=int(arg or 0))
+    raise ValueError(f"Unknown data provider: {spec!r}")
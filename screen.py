@@ -0,0 +1,74 @@
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import dcf
+from fundamentals import get_data
+
+log = logging.getLogger(__name__)
+
+
+def universe_inputs(tickers, workers=16):
+    # Valuation inputs for each ticker, one row each, read by the same functions as
+    # the app's pipeline; tickers without revenue or a market cap are left out
+    def load(ticker):
+        try:
+            data = get_data(ticker, dcf.DCF_FIELDS)
+            revenue = dcf.base_revenue(data)
+            cash, debt, _ = dcf.bridge(data)
+            _, market_cap = dcf.market(data)
+        except (KeyError, IndexError):
+            log.info("Leaving %s out of the screen: no revenue", ticker)
+            return None
+        except Exception:
+            log.exception("Leaving %s out of the screen", ticker)
+            return None
+        if not market_cap:
+            return None
+        return {"ticker": ticker, "revenue": revenue, "cash": cash, "debt": debt, "market_cap": market_cap}
+
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = [row for row in pool.map(load, tickers) if row is not None]
+    return pd.DataFrame(rows, columns=["ticker", "revenue", "cash", "debt", "market_cap"]).set_index("ticker")
+
+
+def implied_returns(tickers, assumptions, years=5, mid_year=False, fade=None, workers=16):
+    # Rank tickers by the expected return their market cap implies under the same
+    # assumptions (their discount rate is ignored); solved for all of them in one call
+    inputs = universe_inputs(tickers, workers)
+    implied = dcf.implied_discount_rate(
+        inputs["market_cap"].to_numpy(), inputs["revenue"].to_numpy(), assumptions,
+        inputs["cash"].to_numpy(), inputs["debt"].to_numpy(), years=years, mid_year=mid_year, fade=fade,
+    )
+    ranked = pd.DataFrame({
+        "Market Cap ($B)": inputs["market_cap"] / 1e9,
+        "Revenue (M)": inputs["revenue"],
+        "Implied Return": implied,
+    }, index=inputs.index)
+    return ranked.sort_values("Implied Return", ascending=False, na_position="last")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank tickers by the return implied by their market price")
+    parser.add_argument("tickers", nargs="*", help="tickers to rank")
+    parser.add_argument("--tickers-file", help="file with one ticker per line")
+    parser.add_argument("--scenario", default="Base", choices=list(dcf.SCENARIOS))
+    parser.add_argument("--terminal-growth", type=float, default=0.025)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="rows to print")
+    args = parser.parse_args()
+
+    tickers = [t.upper() for t in args.tickers]
+    if args.tickers_file:
+        with open(args.tickers_file) as f:
+            tickers += [line.strip().upper() for line in f if line.strip()]
+    logging.basicConfig(level=logging.INFO)
+    growth_rate, ebit_margin = dcf.SCENARIOS[args.scenario]
+    # The app's default sliders for everything but growth and margin
+    assumptions = dcf.Assumptions(growth_rate, ebit_margin, 0.21, 0.06, 0.05, 0.02, np.nan, args.terminal_growth)
+    ranked = implied_returns(tickers, assumptions, years=args.years)
+    print(ranked.head(args.top).to_string(float_format=lambda x: f"{x:,.3f}"))
@@ -0,0 +1,154 @@
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from providers import PAYLOADS, STATEMENTS, Provider, make_provider
+
+log = logging.getLogger(__name__)
+
+
+def _ticker_rows(source, ticker):
+    # One row per period, columns named "<payload>:<field>"; info is repeated on every row
+    frames = []
+    for name in STATEMENTS:
+        frame = source.statement(ticker, name)
+        frames.append(frame.add_prefix(f"{name}:"))
+    rows = pd.concat(frames, axis=1).sort_index(ascending=False)
+    if rows.empty:
+        rows = pd.DataFrame(index=pd.DatetimeIndex([pd.NaT]))
+    info = {f"info:{k}": v for k, v in source.info(ticker).items() if isinstance(v, (str, int, float, bool))}
+    rows = rows.assign(**info)
+    rows.index.name = "period"
+    return rows.reset_index().assign(ticker=ticker.upper())
+
+
+def _to_arrow(column):
+    # Numbers become float64 with NaN kept as a value rather than a null, so the
+    # reader can view them straight out of the mapped file. Info values can mix
+    # types across tickers; anything not numeric is stored as text.
+    if column.dtype == object:
+        values = column.dropna()
+        if values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool)).all():
+            column = column.astype(float)
+        else:
+            return pa.array(column.map(lambda v: v if pd.isna(v) else str(v)), from_pandas=True)
+    if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+        return pa.array(column.to_numpy(dtype=float), from_pandas=False)
+    return pa.array(column, from_pandas=True)
+
+
+def build_snapshot(tickers, path, source, workers=16):
+    # Fetch every ticker and write one uncompressed Arrow file, sorted by ticker so
+    # each ticker's rows are contiguous
+    def load(ticker):
+        try:
+            return _ticker_rows(source, ticker)
+        except Exception:
+            log.exception("Leaving %s out of the snapshot", ticker)
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = [rows for rows in pool.map(load, tickers) if rows is not None]
+    if not parts:
+        raise ValueError("None of the tickers could be fetched")
+    table = pd.concat(parts, ignore_index=True)
+    table = table.sort_values(["ticker", "period"], ascending=[True, False], kind="stable")
+    table = table[["ticker", "period", *(c for c in table.columns if c not in ("ticker", "period"))]]
+    table = pa.table({c: _to_arrow(table[c]) for c in table.columns})
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return len(parts)
+
+
+class Snapshot(Provider):
+    # Memory-maps a snapshot file and serves it like any other provider. Numeric
+    # columns are zero-copy views into the mapping; a lookup only slices the rows
+    # of the requested ticker.
+
+    def __init__(self, path):
+        self.path = path
+        # When the data was taken; cached copies newer than this win over it
+        self.built_at = os.path.getmtime(path)
+        self.table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+        self._arrays = {}
+        tickers = self._array("ticker")
+        starts = np.flatnonzero(np.r_[True, tickers[1:] != tickers[:-1]]) if len(tickers) else np.array([], int)
+        stops = np.r_[starts[1:], len(tickers)]
+        self._rows = {t: (int(a), int(b)) for t, a, b in zip(tickers[starts], starts, stops)}
+        self._fields = {
+            name: [c.partition(":")[2] for c in self.table.column_names if c.startswith(f"{name}:")]
+            for name in PAYLOADS
+        }
+
+    def _array(self, column):
+        # Converted once per column; zero-copy unless the column is text
+        if column not in self._arrays:
+            chunked = self.table.column(column)
+            array = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+            try:
+                self._arrays[column] = array.to_numpy(zero_copy_only=True)
+            except pa.ArrowInvalid:
+                self._arrays[column] = array.to_numpy(zero_copy_only=False)
+        return self._arrays[column]
+
+    def __contains__(self, ticker):
+        return ticker.upper() in self._rows
+
+    def tickers(self):
+        return list(self._rows)
+
+    def _columns(self, ticker, name, fields):
+        start, stop = self._rows[ticker.upper()]
+        names = self._fields[name] if fields is None else [f for f in fields if f in self._fields[name]]
+        return start, stop, {f: self._array(f"{name}:{f}")[start:stop] for f in names}
+
+    def statement(self, ticker, name, fields=None):
+        start, stop, columns = self._columns(ticker, name, fields)
+        # Columns other tickers use are all empty here, as are rows without this statement
+        columns = {f: v for f, v in columns.items() if not pd.isna(v).all()}
+        frame = pd.DataFrame(columns, index=pd.DatetimeIndex(self._array("period")[start:stop]))
+        return frame[frame.notna().any(axis=1)] if columns else frame.iloc[:0]
+
+    def info(self, ticker, fields=None):
+        start, _, columns = self._columns(ticker, "info", fields)
+        info = {}
+        for field, values in columns.items():
+            value = values[0]
+            if not pd.isna(value):
+                info[field] = value.item() if hasattr(value, "item") else value
+        return info
+
+    def get_data(self, ticker, fields=None):
+        # Same shape as fundamentals.get_data: payloads a manifest leaves out come back empty
+        out = []
+        for name in PAYLOADS:
+            if fields is not None and name not in fields:
+                out.append({} if name == "info" else pd.DataFrame())
+            elif name == "info":
+                out.append(self.info(ticker, None if fields is None else fields[name]))
+            else:
+                out.append(self.statement(ticker, name, None if fields is None else fields[name]))
+        return tuple(out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a fundamentals snapshot for a ticker universe")
+    parser.add_argument("output", help="snapshot file to write, e.g. universe.arrow")
+    parser.add_argument("tickers", nargs="*", help="tickers to include")
+    parser.add_argument("--tickers-file", help="file with one ticker per line")
+    parser.add_argument("--provider", default="yfinance", help='"yfinance", "fixture:<dir>" or "synthetic[:<seed>]"')
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    tickers = [t.upper() for t in args.tickers]
+    if args.tickers_file:
+        with open(args.tickers_file) as f:
+            tickers += [line.strip().upper() for line in f if line.strip()]
+    logging.basicConfig(level=logging.INFO)
+    count = build_snapshot(tickers, args.output, make_provider(args.provider), args.workers)
+    print(f"Wrote {count} of {len(tickers)} tickers to {args.output}")
@@ -1,27 +1,78 @@
 import streamlit as st
-import yfinance as yf
-import pandas as pd
 import numpy as np
 import altair as alt
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm, Normalize
+
+import dcf
+from fundamentals import get_data, prefetch
+from pipeline import build_pipeline
+from providers import ProviderUnavailable
+from screen import implied_returns
+
+# Label and slider range of each assumption, for the analyses that vary them
+ASSUMPTIONS = {
+    "growth_rate": ("Revenue Growth Rate", 0.01, 0.20),
+    "ebit_margin": ("EBIT Margin", 0.05, 0.40),
+    "tax_rate": ("Tax Rate", 0.00, 0.50),
+    "capex_pct": ("CapEx (% of Revenue)", 0.01, 0.20),
+    "dep_pct": ("Depreciation (% of Revenue)", 0.01, 0.20),
+    "nwc_pct": ("Change in NWC (% of Revenue)", 0.00, 0.10),
+    "discount_rate": ("Discount Rate", 0.05, 0.15),
+    "terminal_growth": ("Terminal Growth Rate", 0.00, 0.05),
+}
+
+
+def heatmap_figure(x, y, values, xlabel, ylabel, marker, label="Enterprise Value ($B)"):
+    # One rasterized mesh however many cells. NaN cells (d <= g) are left blank; EV
+    # blows up next to them, so the colors are on a log scale (when EV stays
+    # positive) clipped to the bulk of the grid. `marker` is the current (x, y).
+    values = np.ma.masked_invalid(values)
+    low, high = np.percentile(values.compressed(), [1, 99]) if values.count() else (0, 1)
+    fig, ax = plt.subplots()
+    mesh = ax.pcolormesh(x, y, values, shading="nearest", cmap="viridis", rasterized=True,
+                         norm=LogNorm(low, high) if low > 0 else Normalize(low, high))
+    fig.colorbar(mesh, ax=ax, label=label, extend="both")
+    ax.plot(*marker, "r+", markersize=12)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    return fig
+
 
 st.set_page_config(page_title="DCF Valuation", layout="centered")
 
 st.title("📈 Discounted Cash Flow (DCF) Valuation App")
 
-
-
-def get_data(ticker):
-    company = yf.Ticker(ticker)
-    return company.financials.T, company.balance_sheet.T, company.cashflow.T, company.info
+# Each session keeps its own stage results, so a slider only recomputes what depends on it
+if "pipeline" not in st.session_state:
+    st.session_state["pipeline"] = build_pipeline()
+pipe = st.session_state["pipeline"]
 
 # Input Ticker
 ticker = st.text_input("Enter Stock Ticker (e.g., AAPL, TSLA, MSFT)", value="AAPL").upper()
 
+# Watchlist prefetch, so switching between these tickers doesn't wait on the network
+with st.sidebar.expander("📋 Watchlist"):
+    watchlist = st.text_area("Tickers (comma or newline separated)", key="watchlist")
+    if st.button("Prefetch Watchlist"):
+        tickers = watchlist.replace(",", " ").split()
+        bar = st.progress(0.0, text="Prefetching...")
+        results = prefetch(
+            tickers, dcf.DCF_FIELDS, workers=8, rate=5,
+            progress=lambda done, total, t: bar.progress(done / total, text=f"{done}/{total} · {t}"),
+        )
+        failed = [t for t, err in results.items() if err is not None]
+        if failed:
+            st.warning(f"Couldn't prefetch: {', '.join(failed)}")
+        else:
+            st.success(f"Prefetched {len(results)} tickers")
+
 if ticker:
+    refresh = st.sidebar.button("🔄 Refresh Data", help="Ignore cached fundamentals and refetch")
     try:
         with st.spinner("Fetching financials and calculating..."):
-            income, balance, cashflow, info = get_data(ticker)
+            fundamentals = get_data(ticker, dcf.DCF_FIELDS, refresh=refresh)
+            income, balance, cashflow, info = fundamentals
 
             # Company Info
             st.sidebar.markdown(f"**{info.get('longName', 'N/A')}**")
@@ -29,8 +80,7 @@ if ticker:
             st.sidebar.markdown(f"Market Cap: ${info.get('marketCap', 0)/1e9:.2f}B")
 
             # Extract Revenue
-            revenue_series = income['Total Revenue'].dropna()
-            last_revenue = revenue_series.iloc[-1] / 1e6  # in millions
+            last_revenue = pipe.run({"fundamentals": fundamentals}, "base_revenue")
 
             st.success(f"Latest Revenue for {ticker}: ${last_revenue:,.2f}M")
 
@@ -39,12 +89,7 @@ if ticker:
             scenario = st.sidebar.selectbox("Select Scenario", ["Base", "Bull", "Bear"])
 
             # Default values
-            growth_rate = 0.05
-            ebit_margin = 0.25
-            if scenario == "Bull":
-                growth_rate, ebit_margin = 0.10, 0.30
-            elif scenario == "Bear":
-                growth_rate, ebit_margin = 0.03, 0.15
+            growth_rate, ebit_margin = dcf.SCENARIOS[scenario]
 
             growth_rate = st.sidebar.slider("Revenue Growth Rate", 0.01, 0.20, growth_rate, 0.01)
             ebit_margin = st.sidebar.slider("EBIT Margin", 0.05, 0.40, ebit_margin, 0.01)
@@ -54,39 +99,37 @@ if ticker:
             nwc_pct = st.sidebar.slider("Change in NWC (% of Revenue)", 0.00, 0.10, 0.02, 0.005)
             discount_rate = st.sidebar.slider("Discount Rate", 0.05, 0.15, 0.08, 0.005)
             terminal_growth = st.sidebar.slider("Terminal Growth Rate", 0.00, 0.05, 0.025, 0.005)
+            mid_year = st.sidebar.checkbox("Mid-year Discounting", help="Discount each year's cash flow from mid-year")
+
+            # Forecast shape
+            horizon = st.sidebar.slider("Forecast Horizon (Years)", 5, 30, 5, 1)
+            fade = None
+            if st.sidebar.checkbox("Multi-stage Growth", help="Hold growth and margin, then fade them to targets"):
+                hold_years = st.sidebar.slider("High-growth Years", 0, horizon, min(3, horizon), 1)
+                growth_target = st.sidebar.slider("Fade Growth To", 0.00, 0.10, terminal_growth, 0.005)
+                margin_target = st.sidebar.slider("Fade EBIT Margin To", 0.05, 0.40, ebit_margin, 0.01)
+                fade = dcf.Fade(hold_years, growth_target, margin_target)
 
             # Forecast years
-            years = list(range(2024, 2029))
-            fcf_data = []
-
-            for i, year in enumerate(years):
-                revenue = last_revenue * ((1 + growth_rate) ** (i + 1))
-                ebit = revenue * ebit_margin
-                tax = ebit * tax_rate
-                nopat = ebit - tax
-                depreciation = revenue * dep_pct
-                capex = revenue * capex_pct
-                nwc_change = revenue * nwc_pct
-                fcf = nopat + depreciation - capex - nwc_change
-                fcf_data.append({
-                    'Year': year,
-                    'Revenue (M)': revenue,
-                    'EBIT (M)': ebit,
-                    'NOPAT (M)': nopat,
-                    'Depreciation (M)': depreciation,
-                    'CapEx (M)': capex,
-                    '∆NWC (M)': nwc_change,
-                    'FCF (M)': fcf
-                })
-
-            projections = pd.DataFrame(fcf_data)
-            projections['Discount Factor'] = [(1 / (1 + discount_rate) ** (i + 1)) for i in range(len(years))]
-            projections['Discounted FCF (M)'] = projections['FCF (M)'] * projections['Discount Factor']
-
-            tv = projections['FCF (M)'].iloc[-1] * (1 + terminal_growth) / (discount_rate - terminal_growth)
-            tv_disc = tv / ((1 + discount_rate) ** len(years))
-
-            enterprise_value = projections['Discounted FCF (M)'].sum() + tv_disc
+            years = list(range(2024, 2024 + horizon))
+            inputs = {
+                "fundamentals": fundamentals,
+                "growth_rate": growth_rate,
+                "ebit_margin": ebit_margin,
+                "tax_rate": tax_rate,
+                "capex_pct": capex_pct,
+                "dep_pct": dep_pct,
+                "nwc_pct": nwc_pct,
+                "discount_rate": discount_rate,
+                "terminal_growth": terminal_growth,
+                "horizon": len(years),
+                "mid_year": mid_year,
+                "fade": fade,
+                "start_year": years[0],
+            }
+            (_, projections), enterprise_value, (equity_value, price_target), (cash, debt, shares) = pipe.run(
+                inputs, "projections", "enterprise_value", "equity", "bridge"
+            )
 
             # Charts and Tables
             st.subheader("💰 Projected Free Cash Flows")
@@ -106,70 +149,170 @@ if ticker:
             st.metric(label="📌 Estimated Enterprise Value", value=f"${enterprise_value:,.2f}M")
 
             # Equity Value
-            shares = info.get('sharesOutstanding', 0)
-            cash = balance['Cash'].iloc[0] if 'Cash' in balance.columns else 0
-            debt = balance['Long Term Debt'].iloc[0] if 'Long Term Debt' in balance.columns else 0
-            equity_value = enterprise_value * 1e6 - debt + cash
-            price_target = equity_value / shares if shares else 0
-
             st.metric("Estimated Equity Value", f"${equity_value / 1e9:.2f}B")
             st.metric("Estimated Price per Share", f"${price_target:.2f}")
 
+            # Every scenario under the other current assumptions, in one batched call
+            with st.expander("🔀 Compare Scenarios"):
+                st.dataframe(pipe.run(inputs, "scenarios").style.format("{:,.2f}"))
+
             # Sensitivity Table
-            st.subheader("📊 Sensitivity Analysis (EV in $B)")
-            discounts = np.arange(0.07, 0.105, 0.005)
-            growths = np.arange(0.01, 0.045, 0.005)
-            sensitivity = pd.DataFrame(index=[f"{d:.3f}" for d in discounts],
-                                       columns=[f"{g:.3f}" for g in growths])
-
-            for d in discounts:
-                for g in growths:
-                    tv = projections['FCF (M)'].iloc[-1] * (1 + g) / (d - g)
-                    tv_disc = tv / ((1 + d) ** len(years))
-                    fcf_disc = sum(projections['FCF (M)'] * [(1 / (1 + d) ** (i + 1)) for i in range(len(years))])
-                    total_val = fcf_disc + tv_disc
-                    sensitivity.loc[f"{d:.3f}", f"{g:.3f}"] = round(total_val / 1000, 2)
-
-            st.dataframe(sensitivity)
+            st.subheader("📊 Sensitivity Analysis")
+            sensitivity = pipe.run(inputs, "sensitivity")
+
+            # Every output comes from the same evaluation, so switching only changes what's shown
+            col1, col2 = st.columns(2)
+            output = col1.selectbox("Show", list(dcf.GRID_OUTPUTS), format_func=lambda o: dcf.GRID_OUTPUTS[o][0])
+            label, scale = dcf.GRID_OUTPUTS[output]
+            if col2.radio("View", ["Table", "Heatmap"], horizontal=True, key="sensitivity_view") == "Table":
+                st.dataframe(dcf.grid_table(sensitivity, output).style.format("{:,.2f}"))
+            else:
+                col1, col2, col3 = st.columns(3)
+                inputs["heatmap_size"] = col1.slider("Resolution", 50, 1000, 400, 50)
+                inputs["heatmap_discounts"] = col2.slider("Discount Rates", 0.01, 0.20, (0.04, 0.15), 0.005)
+                inputs["heatmap_growths"] = col3.slider("Terminal Growth Rates", 0.00, 0.08, (0.00, 0.05), 0.005)
+                heatmap = pipe.run(inputs, "heatmap")
+
+                st.pyplot(heatmap_figure(heatmap.terminal_growth, heatmap.discount_rate, getattr(heatmap, output) / scale,
+                                         "Terminal Growth Rate", "Discount Rate", (terminal_growth, discount_rate),
+                                         label))
+
+            # Tornado: every assumption shocked down and up, one batched evaluation
+            st.subheader("🌪️ Tornado: One-at-a-time Sensitivity")
+            col1, col2 = st.columns(2)
+            inputs["tornado_shock"] = col1.slider("Shock (± percentage points)", 0.25, 5.0, 1.0, 0.25) / 100
+            measure = col2.radio("Measure", ["EV ($B)", "Price per Share"], horizontal=True)
+            tornado = pipe.run(inputs, "tornado")
+            base = enterprise_value / 1e3 if measure == "EV ($B)" else price_target
+            invalid = tornado[tornado[measure].isna()]
+            if len(invalid):
+                st.caption("Not shown, the shock takes the discount rate to or below terminal growth: " + ", ".join(
+                    f"{ASSUMPTIONS[f][0]} {shock.lower()}" for f, shock in zip(invalid["Assumption"], invalid["Shock"])
+                ))
+            tornado = tornado.dropna(subset=[measure])
+            tornado = tornado.assign(
+                Label=tornado["Assumption"].map(lambda f: ASSUMPTIONS[f][0]),
+                Base=base,
+                Swing=tornado.groupby("Assumption")[measure].transform(lambda v: v.max() - v.min()),
+            )
+            st.altair_chart(
+                alt.Chart(tornado).mark_bar().encode(
+                    x=alt.X(f"{measure}:Q", title=measure, scale=alt.Scale(zero=False)),
+                    x2="Base:Q",
+                    y=alt.Y("Label:N", title=None, sort=alt.EncodingSortField("Swing", order="descending")),
+                    color=alt.Color("Shock:N", scale=alt.Scale(domain=["Down", "Up"], range=["#d62728", "#2ca02c"])),
+                    tooltip=["Label", "Shock", alt.Tooltip(f"{measure}:Q", format=",.2f")],
+                ), use_container_width=True
+            )
+
+            # Sensitivity Cube: evaluated once per set of axes, sliced without recomputing
+            st.subheader("🧊 Sensitivity Cube (EV in $B)")
+            with st.expander("Vary up to six assumptions together"):
+                current = dict(zip(dcf.Assumptions._fields, (
+                    growth_rate, ebit_margin, tax_rate, capex_pct, dep_pct, nwc_pct, discount_rate, terminal_growth,
+                )))
+                fields = st.multiselect("Axes", list(ASSUMPTIONS), default=["discount_rate", "terminal_growth"],
+                                        format_func=lambda f: ASSUMPTIONS[f][0], max_selections=dcf.CUBE_MAX_AXES)
+                axes = []
+                for field in fields:
+                    label, low, high = ASSUMPTIONS[field]
+                    spread = (high - low) / 5
+                    col1, col2 = st.columns([3, 1])
+                    lo, hi = col1.slider(label, low, high, (max(low, current[field] - spread),
+                                                            min(high, current[field] + spread)), key=f"cube_{field}")
+                    axes.append((field, lo, hi, col2.number_input("Steps", 2, 100, 7, key=f"cube_steps_{field}")))
+
+                cells = int(np.prod([steps for *_, steps in axes]))
+                if len(axes) < 2:
+                    st.info("Pick at least two axes.")
+                elif cells > dcf.CUBE_MAX_CELLS:
+                    st.warning(f"{cells:,} cells is more than the {dcf.CUBE_MAX_CELLS:,} allowed; use fewer steps.")
+                else:
+                    inputs["cube_axes"] = tuple(axes)
+                    cube = pipe.run(inputs, "cube")
+                    col1, col2 = st.columns(2)
+                    rows = col1.selectbox("Rows", fields, format_func=lambda f: ASSUMPTIONS[f][0])
+                    columns = col2.selectbox("Columns", [f for f in fields if f != rows], index=0,
+                                             format_func=lambda f: ASSUMPTIONS[f][0])
+                    at = {}
+                    for field in fields:
+                        if field not in (rows, columns):
+                            values = list(cube.axes[field])
+                            held = st.select_slider(f"Hold {ASSUMPTIONS[field][0]} at", values,
+                                                    value=values[len(values) // 2], format_func=lambda v: f"{v:.3f}")
+                            at[field] = values.index(held)
+                    table = dcf.cube_slice(cube, rows, columns, at) / 1e3
+                    if st.radio("View", ["Table", "Heatmap"], horizontal=True, key="cube_view") == "Table":
+                        st.dataframe(table.rename(index="{:.3f}".format, columns="{:.3f}".format)
+                                     .style.format("{:,.2f}"))
+                    else:
+                        st.pyplot(heatmap_figure(table.columns, table.index, table.to_numpy(),
+                                                 ASSUMPTIONS[columns][0], ASSUMPTIONS[rows][0],
+                                                 (current[columns], current[rows])))
 
             # Monte Carlo Simulation
             st.subheader("🎲 Monte Carlo Simulation: Enterprise Value")
-            num_simulations = 1000
-            np.random.seed(42)
-
-            growth_samples = np.random.normal(growth_rate, 0.02, num_simulations)
-            margin_samples = np.random.normal(ebit_margin, 0.03, num_simulations)
-            ev_results = []
-
-            for g, m in zip(growth_samples, margin_samples):
-                temp_fcf = [
-                    (last_revenue * ((1 + g) ** (i + 1))) * m * (1 - tax_rate) +
-                    (last_revenue * ((1 + g) ** (i + 1))) * dep_pct -
-                    (last_revenue * ((1 + g) ** (i + 1))) * capex_pct -
-                    (last_revenue * ((1 + g) ** (i + 1))) * nwc_pct
-                    for i in range(5)
-                ]
-                disc_fcf = sum([cf / (1 + discount_rate) ** (i + 1) for i, cf in enumerate(temp_fcf)])
-                tv_sim = temp_fcf[-1] * (1 + terminal_growth) / (discount_rate - terminal_growth)
-                tv_disc_sim = tv_sim / ((1 + discount_rate) ** 5)
-                ev_results.append(disc_fcf + tv_disc_sim)
+            inputs["simulations"] = st.select_slider("Simulations", [1_000, 10_000, 100_000, 1_000_000], 1_000,
+                                                     format_func="{:,}".format)
+            ev_results = pipe.run(inputs, "monte_carlo")
 
             fig, ax = plt.subplots()
-            ax.hist(np.array(ev_results) / 1e3, bins=50, color='skyblue', edgecolor='black')
+            ax.hist(ev_results / 1e3, bins=50, color='skyblue', edgecolor='black')
             ax.set_title('Monte Carlo Simulation of Enterprise Value')
             ax.set_xlabel('Enterprise Value ($B)')
             ax.set_ylabel('Frequency')
             st.pyplot(fig)
 
-            st.metric("Mean EV from Simulation ($B)", f"{np.mean(ev_results)/1e3:.2f}")
+            st.metric("Mean EV from Simulation ($B)", f"{np.nanmean(ev_results)/1e3:.2f}")
+
+            # Sobol indices: how much of the EV variance each assumption accounts for
+            st.subheader("🧭 What Drives EV: Sobol Indices")
+            col1, col2 = st.columns(2)
+            inputs["sobol_spread"] = col1.slider("Uncertainty (± percentage points)", 0.25, 5.0, 1.0, 0.25) / 100
+            inputs["sobol_samples"] = col2.select_slider("Samples", [1024, 4096, 16384, 65536], 16384)
+            sobol = pipe.run(inputs, "sobol")
+            st.altair_chart(
+                alt.Chart(
+                    sobol.rename(index=lambda f: ASSUMPTIONS[f][0]).rename_axis("Assumption").reset_index()
+                ).transform_fold(["First-order", "Total"], as_=["Index", "Share of Variance"]).mark_bar().encode(
+                    x=alt.X("Share of Variance:Q", axis=alt.Axis(format="%")),
+                    y=alt.Y("Assumption:N", title=None, sort="-x"),
+                    yOffset="Index:N",
+                    color="Index:N",
+                ), use_container_width=True
+            )
+            st.caption("First-order: variance explained by the assumption alone. "
+                       "Total: including its interactions with the others.")
+
+            # Reverse DCF
+            st.subheader("🎯 Reverse DCF: What's Priced In")
+            (implied_growth, implied_margin), implied_return = pipe.run(inputs, "reverse_dcf", "implied_return")
+            if np.isnan(implied_growth) and np.isnan(implied_margin) and np.isnan(implied_return):
+                st.info("No growth, margin or return in range reproduces the current market price.")
+            else:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Market-implied Revenue Growth",
+                            "n/a" if np.isnan(implied_growth) else f"{implied_growth:.1%}",
+                            None if np.isnan(implied_growth) else f"{implied_growth - growth_rate:+.1%} vs. yours")
+                col2.metric("Market-implied EBIT Margin",
+                            "n/a" if np.isnan(implied_margin) else f"{implied_margin:.1%}",
+                            None if np.isnan(implied_margin) else f"{implied_margin - ebit_margin:+.1%} vs. yours")
+                col3.metric("Market-implied Return",
+                            "n/a" if np.isnan(implied_return) else f"{implied_return:.1%}",
+                            None if np.isnan(implied_return) else f"{implied_return - discount_rate:+.1%} vs. yours")
+
+            tickers = watchlist.replace(",", " ").split()
+            if tickers and st.button("Rank Watchlist by Implied Return"):
+                ranked = implied_returns(tickers, dcf.Assumptions(
+                    growth_rate, ebit_margin, tax_rate, capex_pct, dep_pct, nwc_pct, np.nan, terminal_growth,
+                ), years=horizon, mid_year=mid_year, fade=fade)
+                st.dataframe(ranked.style.format({
+                    "Market Cap ($B)": "{:,.2f}", "Revenue (M)": "{:,.2f}", "Implied Return": "{:.2%}",
+                }))
 
             # Download Excel
             st.subheader("📥 Download Valuation as Excel")
-            with pd.ExcelWriter("Valuation_Output.xlsx", engine="openpyxl") as writer:
-                projections.to_excel(writer, sheet_name="Projections", index=False)
-                sensitivity.to_excel(writer, sheet_name="Sensitivity Table")
-            with open("Valuation_Output.xlsx", "rb") as f:
-                st.download_button("Download Excel File", f, file_name="Valuation_Output.xlsx")
+            st.download_button("Download Excel File", pipe.run(inputs, "excel"), file_name="Valuation_Output.xlsx")
 
             # Executive Summary
             st.subheader("🧾 Optional: Executive Summary Generator")
@@ -190,6 +333,8 @@ if ticker:
                 """
                 st.markdown(summary)
 
+    except ProviderUnavailable as pe:
+        st.error(f"Financial data is temporarily unavailable, please try again shortly. ({pe})")
     except KeyError as ke:
         st.error(f"Missing data field: {ke}")
     except Exception as e:
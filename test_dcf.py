@@ -0,0 +1,97 @@
+import numpy as np
+
+import dcf
+
+ASSUMPTIONS = dcf.Assumptions(0.05, 0.25, 0.21, 0.06, 0.05, 0.02, 0.08, 0.025)
+
+
+def test_sobol_indices_converge_at_app_sample_sizes():
+    # A large run stands in for the true indices; the sizes the app offers must land near it
+    reference = dcf.sobol_indices(20_000, ASSUMPTIONS, spread=0.01, samples=1_000_000, seed=7)
+    for samples, tolerance in ((1024, 0.08), (16384, 0.03)):
+        for seed in range(5):
+            estimate = dcf.sobol_indices(20_000, ASSUMPTIONS, spread=0.01, samples=samples, seed=seed)
+            assert np.abs(estimate - reference).to_numpy().max() < tolerance
+
+
+def test_sobol_first_order_does_not_exceed_total():
+    indices = dcf.sobol_indices(20_000, ASSUMPTIONS, spread=0.01, samples=16384)
+    assert (indices["First-order"] <= indices["Total"] + 0.02).all()
+
+
+def test_tornado_masks_shocks_that_cross_terminal_growth():
+    shocked = dcf.tornado(20_000, ASSUMPTIONS._replace(discount_rate=0.06, terminal_growth=0.04), shock=0.02,
+                          cash=1e9, debt=1e9, shares=1e8)
+    d, g = dcf.Assumptions._fields.index("discount_rate"), dcf.Assumptions._fields.index("terminal_growth")
+    for output in shocked:
+        assert np.isnan(output[d, 0]) and np.isnan(output[g, 1])
+        assert np.isfinite(np.delete(output.ravel(), [2 * d, 2 * g + 1])).all()
+    assert (shocked.enterprise_value[~np.isnan(shocked.enterprise_value)] > 0).all()
+
+
+def test_sobol_indices_vary_inputs_sitting_at_zero():
+    at_zero = ASSUMPTIONS._replace(tax_rate=0.0, nwc_pct=0.0, terminal_growth=0.0)
+    indices = dcf.sobol_indices(20_000, at_zero, spread=0.01, samples=16384)
+    assert (indices.loc[["tax_rate", "nwc_pct", "terminal_growth"], "Total"] > 1e-4).all()
+
+
+def _random_assumptions(rng, n):
+    discount_rate = rng.uniform(0.06, 0.15, n)
+    return dcf.Assumptions(
+        growth_rate=rng.uniform(-0.05, 0.2, n),
+        ebit_margin=rng.uniform(0.05, 0.4, n),
+        tax_rate=rng.uniform(0.0, 0.4, n),
+        capex_pct=rng.uniform(0.01, 0.15, n),
+        dep_pct=rng.uniform(0.01, 0.15, n),
+        nwc_pct=rng.uniform(0.0, 0.05, n),
+        discount_rate=discount_rate,
+        terminal_growth=rng.uniform(0.0, 0.05, n).clip(max=discount_rate - 0.01),
+    )
+
+
+def test_closed_form_matches_explicit_schedule():
+    rng = np.random.default_rng(0)
+    sets = _random_assumptions(rng, 2000)
+    # q == 1: growth equal to the discount rate, on and off the discount table grid
+    sets = sets._replace(growth_rate=np.where(np.arange(2000) % 10 == 0, sets.discount_rate, sets.growth_rate))
+    sets = sets._replace(discount_rate=np.where(np.arange(2000) % 20 == 0, 0.08, sets.discount_rate),
+                         growth_rate=np.where(np.arange(2000) % 20 == 0, 0.08, sets.growth_rate))
+    revenue = rng.uniform(100, 1e6, 2000)
+    for years in (1, 5, 30):
+        for mid_year in (False, True):
+            closed = dcf.value(revenue, sets, 1e9, 2e9, 1e8, years=years, mid_year=mid_year, closed_form=True)
+            explicit = dcf.value(revenue, sets, 1e9, 2e9, 1e8, years=years, mid_year=mid_year, closed_form=False)
+            for a, b in zip(closed, explicit):
+                np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-6)
+
+
+def test_closed_form_matches_project_schedule():
+    schedule = dcf.project(20_000, *ASSUMPTIONS[:-1], years=10, mid_year=True)
+    ev = dcf.enterprise_value(schedule, ASSUMPTIONS.discount_rate, ASSUMPTIONS.terminal_growth)
+    np.testing.assert_allclose(dcf.value(20_000, ASSUMPTIONS, years=10, mid_year=True).enterprise_value, ev,
+                               rtol=1e-12)
+
+
+def test_implied_round_trips():
+    rng = np.random.default_rng(1)
+    sets = _random_assumptions(rng, 500)
+    revenue = rng.uniform(100, 1e5, 500)
+    shares = revenue * 1e6 / rng.uniform(20, 200, 500)
+    for field in ("growth_rate", "ebit_margin"):
+        for kwargs in ({}, {"years": 20, "mid_year": True, "fade": dcf.Fade(5, 0.03)}):
+            price = dcf.value(revenue, sets, 1e8, 3e8, shares, **kwargs).price_per_share
+            solved = dcf.implied(field, price, revenue, sets._replace(**{field: 0.0}), 1e8, 3e8, shares, **kwargs)
+            np.testing.assert_allclose(solved, getattr(sets, field), atol=1e-7)
+
+
+def test_implied_discount_rate_round_trips():
+    rng = np.random.default_rng(2)
+    sets = _random_assumptions(rng, 500)
+    revenue = rng.uniform(100, 1e5, 500)
+    for kwargs in ({}, {"years": 30, "mid_year": True}, {"years": 15, "fade": dcf.Fade(3, 0.03, 0.2)}):
+        equity = dcf.value(revenue, sets, 1e8, 3e8, **kwargs).equity_value
+        # The rate is only unique (and bracketed) where every cash flow is positive
+        fcf = dcf.free_cash_flow(revenue, sets, kwargs.get("years", 5), kwargs.get("fade"))
+        positive = (fcf > 0).all(axis=-1)
+        solved = dcf.implied_discount_rate(equity, revenue, sets._replace(discount_rate=np.nan), 1e8, 3e8, **kwargs)
+        np.testing.assert_allclose(solved[positive], sets.discount_rate[positive], atol=1e-8)